@@ -21,25 +21,266 @@
 
 
 # standard library imports
+import os
+import queue
+import itertools
+import threading
+import contextlib
+import multiprocessing
+
 # third party imports
 import pymongo
 
 # library specific imports
 
 
+_LOGGER = multiprocessing.get_logger().getChild(__name__)
+
+#: mongoDB clients (by process ID and client configuration)
+_CLIENTS = {}
+
+
 def get_client(config):
     """Get mongoDB client.
 
+    Clients are cached per process: repeated calls share one
+    connection pool, while a forked worker creates its own client
+    instead of inheriting its parent's.
+
     :param ConfigParser config: mongoDB configuration
 
     :returns: mongoDB client
     :rtype: MongoClient
     """
     try:
-        client = pymongo.MongoClient(**config["client"])
+        kwargs = dict(config["client"])
+        key = (os.getpid(), tuple(sorted(kwargs.items())))
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _CLIENTS[key] = pymongo.MongoClient(**kwargs)
     except KeyError:
         msg = "'client' header required"
         raise RuntimeError(msg)
     except Exception:
         raise
     return client
+
+
+def _get_batches(documents, batch_size):
+    """Get batches.
+
+    The documents are closed (if they can be) once the batches are
+    exhausted or closed themselves.
+
+    :param iterable documents: documents
+    :param int batch_size: batch size
+
+    :returns: batch
+    :rtype: list
+    """
+    documents = iter(documents)
+    try:
+        batch = list(itertools.islice(documents, batch_size))
+        while batch:
+            yield batch
+            batch = list(itertools.islice(documents, batch_size))
+    finally:
+        close = getattr(documents, "close", None)
+        if close:
+            close()
+
+
+def _prefetch(iterable, size):
+    """Prefetch items in a background thread.
+
+    Exceptions raised while iterating are re-raised in the consumer.
+    If the consumer stops early (e.g. because it raised) and closes
+    the generator, the thread stops as well and closes the iterable
+    before the generator's close returns.
+
+    :param iterable iterable: items
+    :param int size: maximum number of prefetched items
+
+    :returns: item
+    :rtype: object
+    """
+    items = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    break
+            else:
+                put((False, None))
+        except Exception as exception:
+            put((False, exception))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close:
+                close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            ok, item = items.get()
+            if not ok:
+                if item is not None:
+                    raise item
+                break
+            yield item
+    finally:
+        stopped.set()
+        # the iterable is closed by the producer, wait for it
+        producer.join()
+
+
+def insert_batched(
+    collection, documents, batch_size=1000, write_concern=None, prefetch=0
+):
+    """Insert documents in batches.
+
+    Each batch is sent in a single unordered insert_many call so that
+    one faulty document does not abort the remainder of its batch.
+
+    With prefetch, the documents are consumed in a background thread
+    that keeps up to that many batches ready, so that producing them
+    (e.g. parsing the XML file) overlaps with the round trips to the
+    server.
+
+    A one-shot import that can simply be rerun may lower the write
+    concern, e.g. WriteConcern(w=1, j=False) to skip waiting for
+    replication and the journal; w=0 (no acknowledgement at all) also
+    hides write errors and should not be used on replica sets.
+
+    :param Collection collection: mongoDB collection
+    :param iterable documents: documents
+    :param int batch_size: batch size
+    :param WriteConcern write_concern: write concern
+    :param int prefetch: number of prefetched batches (0: none)
+
+    :returns: number of inserted documents
+    :rtype: int
+    """
+    if write_concern is not None:
+        collection = collection.with_options(write_concern=write_concern)
+    batches = _get_batches(documents, batch_size)
+    if prefetch:
+        batches = _prefetch(batches, prefetch)
+    count = 0
+    # close the batches right away if an insert fails: the traceback
+    # keeps this frame (and the suspended generators) alive otherwise
+    with contextlib.closing(batches):
+        for batch in batches:
+            # inserted_ids does not list RawBSONDocuments, count the batch
+            collection.insert_many(batch, ordered=False)
+            count += len(batch)
+    return count
+
+
+def _get_index_model(index):
+    """Get index model from an index specification.
+
+    :param dict index: index specification (as listed by mongoDB)
+
+    :returns: index model
+    :rtype: IndexModel
+    """
+    return pymongo.IndexModel(
+        list(index["key"].items()),
+        **{
+            key: value for key, value in index.items()
+            if key not in ("key", "ns", "v")
+        }
+    )
+
+
+def _create_indexes(collection, indexes):
+    """Create indexes from their specifications.
+
+    The indexes are built together; if that fails (e.g. because the
+    documents violate a unique index), they are created one by one so
+    that only the failing ones are missing. Their specifications are
+    logged and the first error is raised.
+
+    :param Collection collection: mongoDB collection
+    :param list indexes: index specifications (as listed by mongoDB)
+    """
+    if not indexes:
+        return
+    try:
+        collection.create_indexes(
+            [_get_index_model(index) for index in indexes]
+        )
+    except pymongo.errors.PyMongoError:
+        failed = []
+        error = None
+        for index in indexes:
+            try:
+                collection.create_indexes([_get_index_model(index)])
+            except pymongo.errors.PyMongoError as exception:
+                failed.append(index)
+                error = error or exception
+        if failed:
+            _LOGGER.error(
+                "failed to recreate indexes of %s: %r",
+                collection.full_name, failed
+            )
+            raise error
+
+
+@contextlib.contextmanager
+def import_mode(collection, indexes):
+    """Drop secondary indexes of a collection during a bulk import.
+
+    The given indexes are recreated from their specifications on exit,
+    so that each index is built once over all imported documents
+    instead of being updated for every insert. Uniqueness is only
+    enforced again then: a unique index the imported documents violate
+    fails to build on exit (and is left out, see _create_indexes), so
+    list unique indexes only if the data is known to satisfy them. If
+    the import itself failed, such an error is logged and the import's
+    exception is raised instead.
+
+    :param Collection collection: mongoDB collection
+    :param list indexes: names of the indexes to drop
+
+    :returns: mongoDB collection
+    :rtype: Collection
+    """
+    specifications = {
+        index["name"]: index for index in collection.list_indexes()
+    }
+    for name in indexes:
+        if name == "_id_":
+            msg = "index '_id_' cannot be dropped"
+            raise ValueError(msg)
+        if name not in specifications:
+            msg = f"no index '{name}' on {collection.full_name}"
+            raise ValueError(msg)
+    dropped = []
+    try:
+        for name in indexes:
+            collection.drop_index(name)
+            dropped.append(specifications[name])
+        yield collection
+    except BaseException:
+        try:
+            _create_indexes(collection, dropped)
+        except Exception:
+            _LOGGER.exception(
+                "failed to recreate indexes of %s", collection.full_name
+            )
+        raise
+    _create_indexes(collection, dropped)
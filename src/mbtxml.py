@@ -23,101 +23,201 @@ of the German Bundestag and printed matters
 
 
 # standard library imports
+import io
+import os
 import sys
 import logging
 import datetime
+import weakref
+import functools
+import threading
 import multiprocessing
 
 # third party imports
-import bs4
+from lxml import etree
 
 # library specific imports
 
 
+_LOGGER = multiprocessing.get_logger().getChild(__name__)
+_LOGGER.setLevel(logging.INFO)
+if not _LOGGER.handlers:
+    _LOGGER.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+#: number of records sent to a worker process at once
+_CHUNKSIZE = 64
+
+#: date elements
+_DATES = frozenset((
+    "HISTORIE_VON", "HISTORIE_BIS",
+    "GEBURTSDATUM", "STERBEDATUM",
+    "MDBINS_VON", "MDBINS_BIS", "FKTINS_VON", "FKTINS_BIS",
+    "MDBWP_VON", "MDBWP_BIS"
+))
+#: elements with few distinct values (their text is interned)
+_INTERNED = frozenset((
+    "ADEL", "PRAEFIX", "ANREDE_TITEL", "AKAD_TITEL",
+    "GESCHLECHT", "RELIGION", "PARTEI_KURZ",
+    "WKR_LAND", "LISTE", "MANDATSART",
+    "INSART_LANG", "INS_LANG", "FKT_LANG"
+))
+
+
+@functools.lru_cache(maxsize=8192)
 def _get_datetime(date):
     """Get datetime object.
 
+    The results are cached since the same dates (e.g. the beginning
+    and end of each Wahlperiode) recur across many records.
+
     :param str date: date (DD.MM.YYYY)
 
-    :returns: date
+    :returns: date (None if empty)
     :rtype: datetime
     """
-    try:
-        args = [int(word) for word in date.split(".") if word][::-1]
-        if len(args):
-            date = datetime.datetime(*args)
-    except Exception:
-        raise
+    if date:
+        date = datetime.datetime.fromisoformat(
+            f"{date[6:10]}-{date[3:5]}-{date[:2]}"
+        )
+    else:
+        date = None
     return date
 
 
+def _get_children(root, tags=None):
+    """Get children.
+
+    Collects the text of all child elements in a single pass; the
+    text of date elements is converted to datetime objects, the text
+    of elements with few distinct values is interned so that the
+    records share one string object per value.
+
+    :param Element root: root
+    :param frozenset tags: tags of the children to collect (None: all)
+
+    :returns: children
+    :rtype: dict
+    """
+    children = {
+        element.tag.lower():
+        _get_datetime(element.text or "") if element.tag in _DATES
+        else sys.intern(element.text or "") if element.tag in _INTERNED
+        else element.text or ""
+        for element in root.iterchildren(etree.Element)
+        if tags is None or element.tag in tags
+    }
+    return children
+
+
+def _parse_mdb(mdb, tags=None, encode=None):
+    """Parse mdb.
+
+    :param bytes mdb: serialized <MDB> element
+    :param frozenset tags: tags of the fields to find (None: all)
+    :param callable encode: mdb encoder
+
+    :returns: mdb
+    :rtype: dict
+    """
+    mdb = MBTStammdaten._find_mdb(etree.fromstring(mdb), tags=tags)
+    if encode:
+        mdb = encode(mdb)
+    return mdb
+
+
 class MBTXML(object):
     """meinBT XML file parser.
 
     :ivar int pid: process ID
-    :ivar BeautifulSoup soup: XML file tree
+    :ivar bytes xml: XML file content
+    :ivar str path: XML file path
     """
 
     def __init__(self, pid, xml):
         """Initialize meinBT XML file parser.
 
+        If a path is given, the file is not read into memory; it is
+        parsed directly from disk each time, so that several workers
+        parsing the same (e.g. extracted) file share the page cache
+        instead of holding a copy each.
+
         :param int pid: process ID
-        :param ZipExtFile xml: XML file
+        :param xml: XML file or path
+        :type xml: ZipExtFile or str
         """
-        logger = multiprocessing.get_logger().getChild(__name__)
-        logger.setLevel(logging.INFO)
-        logger.addHandler(logging.StreamHandler(stream=sys.stdout))
         self.pid = pid
-        logger.info("worker %d parses XML file %s", self.pid, xml.name)
+        self.xml = None
+        self.path = None
+        if isinstance(xml, (str, os.PathLike)):
+            self.path = os.fspath(xml)
+            _LOGGER.info(
+                "worker %d parses XML file %s", self.pid, self.path
+            )
+            return
+        _LOGGER.info("worker %d parses XML file %s", self.pid, xml.name)
         try:
-            self.soup = bs4.BeautifulSoup(xml, "lxml")
+            self.xml = xml.read()
         except OSError:
-            logger.exception(
-                "worker %d failed to parse XML file", self.pid, xml.name
+            _LOGGER.exception(
+                "worker %d failed to read XML file %s", self.pid, xml.name
             )
         return
 
-    def _find_element(self, name, root=None):
-        """Find element.
+    def _get_source(self):
+        """Get XML source.
 
-        :param str name: element name
-        :param Tag root: root
+        :returns: XML file path or file object
+        :rtype: str or BytesIO
+        """
+        if self.path is not None:
+            source = self.path
+        else:
+            source = io.BytesIO(self.xml)
+        return source
 
-        :returns: element
-        :rtype: Tag
+    def _parse(self):
+        """Parse XML file.
+
+        :returns: root element
+        :rtype: Element
         """
-        try:
-            if root:
-                element = root.find(name=name)
-            else:
-                element = self.soup.find(name=name)
-        except Exception:
-            raise
-        return element
-
-    def _find_all_elements(self, name, root=None):
-        """Find all elements.
-
-        :param str name: element name
-        :param Tag root: root element
-
-        :returns: elements
-        :rtype: ResultSet
+        root = etree.parse(self._get_source()).getroot()
+        return root
+
+    def _iterparse(self, tag):
+        """Parse XML file incrementally.
+
+        Each element is cleared once it has been processed, together
+        with its preceding siblings, so that the tree never holds more
+        than one element at a time. Whitespace between elements is
+        dropped by the parser rather than kept as text nodes.
+
+        :param str tag: element tag
+
+        :returns: element
+        :rtype: Element
         """
-        try:
-            if root:
-                elements = root.find_all(name=name)
-            else:
-                elements = self.soup.find_all(name=name)
-        except Exception:
-            raise
-        return elements
+        for _, element in etree.iterparse(
+            self._get_source(), events=("end",), tag=tag,
+            remove_blank_text=True
+        ):
+            yield element
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
 
 
 class MBTStammdaten(MBTXML):
     """Biographical data of the Members of the German Bundestag
     XML file parser."""
 
+    #: name elements
+    _NAMEN = etree.XPath("NAMEN/NAME")
+    #: institution elements
+    _INSTITUTIONEN = etree.XPath("INSTITUTIONEN/INSTITUTION")
+    #: wahlperiode elements
+    _WAHLPERIODEN = etree.XPath("WAHLPERIODEN/WAHLPERIODE")
+
     def find_version(self):
         """Find version.
 
@@ -125,396 +225,332 @@ class MBTStammdaten(MBTXML):
         :rtype: str
         """
         # total number: 1
-        try:
-            version = self._find_element("version").get_text()
-        except Exception:
-            raise
+        version = None
+        for element in self._iterparse("VERSION"):
+            version = element.text
+            break
         return version
 
-    def _find_id(self, root):
+    @classmethod
+    def _find_id(cls, root):
         """Find id.
 
-        :param Tag root: root
+        :param Element root: root
 
         :returns: id
         :rtype: str
         """
         # total number: 1
-        try:
-            id_ = self._find_element("id", root=root).get_text()
-        except Exception:
-            raise
+        element = next(root.iterchildren("ID"), None)
+        if element is not None:
+            id_ = element.text or ""
+        else:
+            id_ = None
         return id_
 
-    def _find_name(self, root):
+    @classmethod
+    def _find_name(cls, root, tags=None):
         """Find name.
 
-        :param Tag root: root
+        :param Element root: root
+        :param frozenset tags: tags of the fields to find (None: all)
 
         :returns: name
         :rtype: dict
         """
-        try:
-            name = {
-                "nachname":
-                self._find_element("nachname", root=root).get_text(),
-                "vorname":
-                self._find_element("vorname", root=root).get_text(),
-                "ortszusatz":
-                self._find_element("ortszusatz", root=root).get_text(),
-                "adel":
-                self._find_element("adel", root=root).get_text(),
-                "praefix":
-                self._find_element("praefix", root=root).get_text(),
-                "anrede_titel":
-                self._find_element("anrede_titel", root=root).get_text(),
-                "akad_titel":
-                self._find_element("akad_titel", root=root).get_text(),
-                "historie_von":
-                _get_datetime(
-                    self._find_element("historie_von", root=root).get_text()
-                ),
-                "historie_bis":
-                _get_datetime(
-                    self._find_element("historie_bis", root=root).get_text()
-                )
-            }
-        except Exception:
-            raise
+        name = _get_children(root, tags=tags)
         return name
 
-    def _find_namen(self, root):
+    @classmethod
+    def _find_namen(cls, root, tags=None):
         """Find namen.
 
-        :param Tag root: root
+        :param Element root: root
+        :param frozenset tags: tags of the fields to find (None: all)
 
         :returns: namen
         :rtype: list
         """
         # total number: 1
-        try:
-            element = self._find_element("namen", root=root)
-            if element:
-                root = element
-                # total number: 1-
-                namen = [
-                    self._find_name(element) for element in
-                    self._find_all_elements("name", root=root)
-                    if element
-                ]
-            else:
-                namen = []
-        except Exception:
-            raise
+        find_name = cls._find_name
+        # total number: 1-
+        namen = [
+            find_name(element, tags=tags)
+            for element in cls._NAMEN(root)
+        ]
         return namen
 
-    def _find_biografische_angaben(self, root):
+    @classmethod
+    def _find_biografische_angaben(cls, root, tags=None):
         """Find biografische_angaben.
 
-        :param Tag root: root
+        :param Element root: root
+        :param frozenset tags: tags of the fields to find (None: all)
 
         :returns: biografische_angaben
         :rtype: dict
         """
         # total number: 1
-        try:
-            element = self._find_element("biografische_angaben", root=root)
-            if element:
-                biografische_angaben = {
-                    "geburtsdatum":
-                    _get_datetime(
-                        self._find_element(
-                            "geburtsdatum", root=element
-                        ).get_text()
-                    ),
-                    "geburtsort":
-                    self._find_element("geburtsort", root=element).get_text(),
-                    "geburtsland":
-                    self._find_element("geburtsland", root=element).get_text(),
-                    "sterbedatum":
-                    _get_datetime(
-                        self._find_element(
-                            "sterbedatum", root=element
-                        ).get_text()
-                    ),
-                    "geschlecht":
-                    self._find_element("geschlecht", root=element).get_text(),
-                    "familienstand":
-                    self._find_element(
-                        "familienstand", root=element
-                    ).get_text().split(","),
-                    "religion":
-                    self._find_element("religion", root=element).get_text(),
-                    "beruf":
-                    self._find_element(
-                        "beruf", root=element
-                    ).get_text().split(","),
-                    "partei_kurz":
-                    self._find_element("partei_kurz", root=element).get_text(),
-                    "vita_kurz":
-                    self._find_element("vita_kurz", root=element).get_text(),
-                    "veroeffentlichungspflichtiges":
-                    self._find_element(
-                        "veroeffentlichungspflichtiges", root=element
-                    ).get_text()
-                }
-            else:
-                biografische_angaben = {}
-        except Exception:
-            raise
+        element = next(root.iterchildren("BIOGRAFISCHE_ANGABEN"), None)
+        if element is not None:
+            biografische_angaben = _get_children(element, tags=tags)
+            for key in ("familienstand", "beruf"):
+                if key in biografische_angaben:
+                    biografische_angaben[key] = [
+                        sys.intern(value)
+                        for value in biografische_angaben[key].split(",")
+                    ]
+        else:
+            biografische_angaben = {}
         return biografische_angaben
 
-    def _find_institution(self, root):
+    @classmethod
+    def _find_institution(cls, root, tags=None):
         """Find institution.
 
-        :param Tag root: root
+        :param Element root: root
+        :param frozenset tags: tags of the fields to find (None: all)
 
         :returns: institution
         :rtype: dict
         """
-        try:
-            institution = {
-                "insart_lang":
-                self._find_element("insart_lang", root=root).get_text(),
-                "ins_lang":
-                self._find_element("ins_lang", root=root).get_text(),
-                "mdbins_von":
-                _get_datetime(
-                    self._find_element("mdbins_von", root=root).get_text()
-                ),
-                "mdbins_bis":
-                _get_datetime(
-                    self._find_element("mdbins_bis", root=root).get_text()
-                ),
-                "fkt_lang":
-                self._find_element("fkt_lang", root=root).get_text(),
-                "fktins_von":
-                _get_datetime(
-                    self._find_element("fktins_von", root=root).get_text()
-                ),
-                "fktins_bis":
-                _get_datetime(
-                    self._find_element("fktins_bis", root=root).get_text()
-                )
-            }
-        except Exception:
-            raise
+        institution = _get_children(root, tags=tags)
         return institution
 
-    def _find_institutionen(self, root):
+    @classmethod
+    def _find_institutionen(cls, root, tags=None):
         """Find institutionen.
 
-        :param Tag root: root
+        :param Element root: root
+        :param frozenset tags: tags of the fields to find (None: all)
 
         :returns: institutionen
         :rtype: list
         """
         # total number: 1
-        try:
-            element = self._find_element("institutionen", root=root)
-            if element is not None:
-                # total number: 1-
-                root = element
-                institutionen = [
-                    self._find_institution(element) for element in
-                    self._find_all_elements("institution", root=element)
-                    if element
-                ]
-            else:
-                institutionen = []
-        except Exception:
-            raise
+        find_institution = cls._find_institution
+        # total number: 1-
+        institutionen = [
+            find_institution(element, tags=tags)
+            for element in cls._INSTITUTIONEN(root)
+        ]
         return institutionen
 
-    def _find_wahlperiode(self, root):
+    @classmethod
+    def _find_wahlperiode(cls, root, tags=None):
         """Find wahlperiode.
 
-        :param Tag root: root
+        :param Element root: root
+        :param frozenset tags: tags of the fields to find (None: all)
 
         :returns: wahlperiode
         :rtype: dict
         """
-        try:
-            wahlperiode = {
-                "wp": self._find_element("wp", root=root).get_text(),
-                "mdbwp_von":
-                _get_datetime(
-                    self._find_element("mdbwp_von", root=root).get_text()
-                ),
-                "mdbwp_bis":
-                _get_datetime(
-                    self._find_element("mdbwp_bis", root=root).get_text()
-                ),
-                "wkr_nummer":
-                self._find_element("wkr_nummer", root=root).get_text(),
-                "wkr_name":
-                self._find_element("wkr_name", root=root).get_text(),
-                "wkr_land":
-                self._find_element("wkr_land", root=root).get_text(),
-                "liste":
-                self._find_element("liste", root=root).get_text(),
-                "mandatsart":
-                self._find_element("mandatsart", root=root).get_text(),
-                "institutionen":
-                self._find_institutionen(root)
-            }
-        except Exception:
-            raise
+        wahlperiode = _get_children(root, tags=tags)
+        if tags is None or "INSTITUTIONEN" in tags:
+            wahlperiode["institutionen"] = cls._find_institutionen(
+                root, tags=tags
+            )
         return wahlperiode
 
-    def _find_wahlperioden(self, root):
+    @classmethod
+    def _find_wahlperioden(cls, root, tags=None):
         """Find wahlperioden.
 
-        :param Tag root: root
+        :param Element root: root
+        :param frozenset tags: tags of the fields to find (None: all)
 
         :returns: wahlperioden
         :rtype: list
         """
         # total number: 1
-        try:
-            element = self._find_element("wahlperioden", root=root)
-            if element:
-                # total number: 1-
-                root = element
-                wahlperioden = [
-                    self._find_wahlperiode(element) for element in
-                    self._find_all_elements("wahlperiode", root=root)
-                    if element
-                ]
-            else:
-                wahlperioden = []
-        except Exception:
-            raise
+        find_wahlperiode = cls._find_wahlperiode
+        # total number: 1-
+        wahlperioden = [
+            find_wahlperiode(element, tags=tags)
+            for element in cls._WAHLPERIODEN(root)
+        ]
         return wahlperioden
 
-    def find_mdb(self):
+    @classmethod
+    def _find_mdb(cls, root, tags=None):
         """Find mdb.
 
+        :param Element root: root
+        :param frozenset tags: tags of the fields to find (None: all)
+
+        :returns: mdb
+        :rtype: dict
+        """
+        mdb = {}
+        if tags is None or "ID" in tags:
+            mdb["id"] = cls._find_id(root)
+        if tags is None or "NAMEN" in tags:
+            mdb["namen"] = cls._find_namen(root, tags=tags)
+        if tags is None or "BIOGRAFISCHE_ANGABEN" in tags:
+            mdb["biografische_angaben"] = (
+                cls._find_biografische_angaben(root, tags=tags)
+            )
+        if tags is None or "WAHLPERIODEN" in tags:
+            mdb["wahlperioden"] = cls._find_wahlperioden(root, tags=tags)
+        return mdb
+
+    def find_mdb(self, fields=None, processes=1, encode=None):
+        """Find mdb.
+
+        If fields are given, only those fields are extracted; nested
+        records (namen, biografische_angaben, wahlperioden and
+        institutionen) have to be listed themselves, e.g.
+        {"id", "namen", "nachname", "vorname"}.
+
+        With more than one process, the serialized <MDB> elements are
+        parsed by a pool of worker processes and the records are
+        yielded in completion order. Daemonic processes (e.g. pool
+        workers) cannot start such a pool.
+
+        If an encoder is given, it is applied to each record before it
+        is yielded, in the worker processes if there are any; e.g.
+        bson.encode hands back BSON bytes, which are much cheaper to
+        pass between processes than dicts and can be inserted as
+        RawBSONDocument without being encoded again.
+
+        :param set fields: fields (None: all)
+        :param int processes: number of processes (None: CPU count)
+        :param callable encode: mdb encoder
+
         :returns: mdb
         :rtype: dict
         """
         # total number: 1-
-        try:
-            for element in self._find_all_elements("mdb"):
-                if element:
-                    mdb = {
-                        "id":
-                        self._find_element("id", root=element).get_text(),
-                        "namen": self._find_namen(element),
-                        "biografische_angaben":
-                        self._find_biografische_angaben(element),
-                        "wahlperioden":
-                        self._find_wahlperioden(element)
-                    }
-                else:
-                    mdb = {}
+        if fields is not None:
+            tags = frozenset(field.upper() for field in fields)
+        else:
+            tags = None
+        if processes == 1:
+            for element in self._iterparse("MDB"):
+                mdb = self._find_mdb(element, tags=tags)
+                if encode:
+                    mdb = encode(mdb)
                 yield mdb
-        except Exception:
-            raise
+        else:
+            processes = processes or os.cpu_count()
+            # the pool feeds its workers from a separate thread and
+            # buffers their results, bound the number of records in
+            # flight so that it cannot run ahead of the consumer
+            slots = threading.Semaphore(2 * processes * _CHUNKSIZE)
+            stopped = threading.Event()
+
+            def serialize():
+                # runs in the pool's feeder thread, which has to be
+                # joined when the pool is terminated, so never wait
+                # on the consumer without checking whether it (or
+                # the interpreter) gave up
+                for element in self._iterparse("MDB"):
+                    while not slots.acquire(timeout=0.1):
+                        if (
+                            stopped.is_set()
+                            or not threading.main_thread().is_alive()
+                        ):
+                            return
+                    if stopped.is_set():
+                        return
+                    yield etree.tostring(element)
+
+            with multiprocessing.Pool(processes=processes) as pool:
+                # the generator may be left suspended until exit
+                weakref.finalize(pool, stopped.set)
+                try:
+                    for mdb in pool.imap_unordered(
+                        functools.partial(
+                            _parse_mdb, tags=tags, encode=encode
+                        ),
+                        serialize(),
+                        chunksize=_CHUNKSIZE
+                    ):
+                        slots.release()
+                        yield mdb
+                finally:
+                    stopped.set()
 
 
 class MBTDrucksachen(MBTXML):
     """Printed matters XML parser."""
 
-    def _find_drs_typ(self, root=None):
+    def _find_drs_typ(self, root):
         """Find drs_typ.
 
-        :param Tag root: root
+        :param Element root: root
 
         :returns: drs_typ
         :rtype: str
         """
         # total number: 0-1
-        try:
-            element = self._find_element("drs_typ", root=root)
-            if element:
-                drs_typ = element.get_text()
-            else:
-                drs_typ = ""
-        except Exception:
-            raise
+        drs_typ = root.findtext("DRS_TYP", default="")
         return drs_typ
 
-    def _find_titel(self, root=None):
+    def _find_titel(self, root):
         """Find titel.
 
-        :param Tag root: root
+        :param Element root: root
 
         :returns: titel
         :rtype: str
         """
         # total number: 0-1
-        try:
-            element = self._find_element("titel", root=root)
-            if element:
-                titel = element.get_text()
-            else:
-                titel = ""
-        except Exception:
-            raise
+        titel = root.findtext("TITEL", default="")
         return titel
 
-    def _find_k_urheber(self, root=None):
+    def _find_k_urheber(self, root):
         """Find k_urheber.
 
-        :param Tag root: root
+        :param Element root: root
 
         :returns: k_urheber
         :rtype: list
         """
         # total number: 0-n
-        try:
-            k_urheber = []
-            elements = self._find_all_elements("k_urheber", root=root)
-            for element in elements:
-                k_urheber.append(element.get_text())
-        except Exception:
-            raise
+        k_urheber = [
+            element.text or "" for element in root.iterfind("K_URHEBER")
+        ]
         return k_urheber
 
-    def _find_p_urheber(self, root=None):
+    def _find_p_urheber(self, root):
         """Find p_urheber.
 
-        :param Tag root: root
+        :param Element root: root
 
         :returns: p_urheber
         :rtype: list
         """
         # total number: 0-n
-        try:
-            p_urheber = []
-            elements = self._find_all_elements("p_urheber", root=root)
-            for element in elements:
-                p_urheber.append(element.get_text())
-        except Exception:
-            raise
+        p_urheber = [
+            element.text or "" for element in root.iterfind("P_URHEBER")
+        ]
         return p_urheber
 
-    def find_dokument(self):
+    def find_dokument(self, text=True):
         """Find dokument.
 
+        The text is by far the largest field, consumers which only need
+        the metadata can leave it out.
+
+        :param bool text: toggle extracting the text on/off
+
         :returns: dokument
         :rtype: dict
         """
         # total number: 1
-        try:
-            element = self._find_element("dokument")
-            dokument = {
-                "wahlperiode":
-                self._find_element("wahlperiode", root=element).get_text(),
-                "dokumentart":
-                self._find_element("dokumentart", root=element).get_text(),
-                "drs_typ": self._find_drs_typ(root=element),
-                "nr": self._find_element("nr", root=element).get_text(),
-                "datum":
-                _get_datetime(
-                    self._find_element("datum", root=element).get_text()
-                ),
-                "titel": self._find_titel(root=element),
-                "k_urheber": self._find_k_urheber(root=element),
-                "p_urheber": self._find_p_urheber(root=element),
-                "text": self._find_element("text", root=element).get_text()
-            }
-        except Exception:
-            raise
+        element = next(self._parse().iter("DOKUMENT"))
+        dokument = {
+            "wahlperiode": element.findtext("WAHLPERIODE"),
+            "dokumentart": element.findtext("DOKUMENTART"),
+            "drs_typ": self._find_drs_typ(element),
+            "nr": element.findtext("NR"),
+            "datum": _get_datetime(element.findtext("DATUM")),
+            "titel": self._find_titel(element),
+            "k_urheber": self._find_k_urheber(element),
+            "p_urheber": self._find_p_urheber(element)
+        }
+        if text:
+            dokument["text"] = element.findtext("TEXT")
         return dokument